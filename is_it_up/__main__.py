@@ -1,19 +1,24 @@
 """Main module, contains logic for web app"""
 
+import re
+
+from asyncio import Task, create_task, shield
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from random import choice
+from http import HTTPStatus
+from os import environ
+from time import time
 from typing import Any
-from urllib.parse import urlparse
 
 import uvicorn
 
-from cachetools import TTLCache
+from aiohttp import AsyncResolver, ClientError, ClientSession, ClientTimeout, DummyCookieJar, TCPConnector
 from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import RedirectResponse
-from httpx import AsyncClient, RequestError
-from spawn_user_agent.user_agent import SpawnUserAgent
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, RedirectResponse
 
-from .utils import NullCookieJar, TokenBucketRateLimiter
+from .utils import ExpiringDict, TokenBucketRateLimiter
 
 _REPO_URL = "https://github.com/fastily/is-it-up"
 _DESC = f"""\
@@ -30,24 +35,59 @@ This is useful for instances when you can't access a website and want to check i
 ### Source
 * [GitHub]({_REPO_URL})
 """
+_CACHE_SHARDS = 16  # must be a power of two
 _DOCS_URL = "/docs"
+_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"}
 _UNREACHABLE_STATUS = -1
-_USER_AGENTS = SpawnUserAgent.generate_all()
+_WEBSITE_REGEX = re.compile(r"(?:(https?)://)?([A-Za-z0-9.-]+)", re.IGNORECASE)
+
+_timestamp_cache = [0, ""]  # [epoch second, iso8601 formatted timestamp for that second]
 
-client = AsyncClient(http2=True, cookies=NullCookieJar())
-cache = TTLCache(2^16, 60*5)
+session: ClientSession  # aiohttp sessions must be created inside a running event loop, see _lifespan()
+caches = tuple(ExpiringDict(60 * 5) for _ in range(_CACHE_SHARDS))  # sharded by url hash, see _cache_for()
+in_flight: dict[str, Task[tuple[int, str]]] = {}
 limiter = TokenBucketRateLimiter()
 
-app = FastAPI(title="Is it Up?", description=_DESC, version="0.0.1", debug=True)
+
+@asynccontextmanager
+async def _lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """Creates the shared aiohttp session on startup and closes it on shutdown.
+
+    Args:
+        _ (FastAPI): The app being started.  Unused.
+    """
+    global session
+    session = ClientSession(headers=_HEADERS, connector=TCPConnector(limit=1000, resolver=AsyncResolver(), ttl_dns_cache=300, keepalive_timeout=30), cookie_jar=DummyCookieJar(), timeout=ClientTimeout(total=5, connect=3))
+    yield
+    await session.close()
+
+
+app = FastAPI(title="Is it Up?", description=_DESC, version="0.0.1", debug=environ.get("IS_IT_UP_DEBUG") == "1", default_response_class=ORJSONResponse, lifespan=_lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=6)
 
 
 def _now_timestamp() -> str:
-    """Convenience method, gets the current date & time in the iso8061 format
+    """Convenience method, gets the current date & time in the iso8061 format.  The formatted value is reused for all calls made within the same second.
 
     Returns:
         str: The current date & time in the iso8061 format
     """
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    if (t := int(time())) != _timestamp_cache[0]:
+        _timestamp_cache[:] = [t, datetime.fromtimestamp(t, timezone.utc).isoformat()]
+
+    return _timestamp_cache[1]
+
+
+def _cache_for(u: str) -> ExpiringDict:
+    """Convenience method, gets the cache shard responsible for a url
+
+    Args:
+        u (str): The normalized url of a website
+
+    Returns:
+        ExpiringDict: The cache shard `u` belongs to
+    """
+    return caches[hash(u) & (_CACHE_SHARDS - 1)]
 
 
 def _result_with_status(status: int, last_checked: str, cached: bool = False) -> dict[str, Any]:
@@ -64,42 +104,66 @@ def _result_with_status(status: int, last_checked: str, cached: bool = False) ->
     return {"status": status, "last_checked": last_checked, "cached": cached}
 
 
+async def _query_website(u: str) -> tuple[int, str]:
+    """Queries a website to see if it is online and caches the result.
+
+    Args:
+        u (str): The normalized url of the website to query
+
+    Returns:
+        tuple[int, str]: The status code of the website and the timestamp at which it was checked
+    """
+    try:
+        async with session.head(u, allow_redirects=False) as response:
+            status = response.status
+
+        if status == HTTPStatus.METHOD_NOT_ALLOWED:
+            async with session.get(u, headers={"Range": "bytes=0-0"}, allow_redirects=False) as response:
+                status = response.status
+
+        result = (status, _now_timestamp())
+    except (ClientError, TimeoutError):
+        result = (_UNREACHABLE_STATUS, _now_timestamp())
+
+    _cache_for(u)[u] = result
+    return result
+
+
 @app.get("/", include_in_schema=False)
 async def main():
     """Index, redirects to docs"""
     return RedirectResponse(_DOCS_URL)
 
 
-@app.get("/check")
-async def check_website(website: str = Query(max_length=128, pattern=r"[A-Za-z0-9.-]+")) -> dict[str, Any]:
+@app.get("/check", response_model=None)
+async def check_website(website: str = Query(min_length=3, max_length=128, pattern=r"[A-Za-z0-9.-]+")) -> dict[str, Any]:
     """Main endpoint logic for checking if a website is online.
 
     Args:
-        website (str, optional): The website to check. Defaults to Query(max_length=100, regex=r"[A-Za-z0-9.-]+").
+        website (str, optional): The website to check. Defaults to Query(min_length=3, max_length=128, pattern=r"[A-Za-z0-9.-]+").
 
     Returns:
         dict[str, Any]: The result, containing info about whether the website was reachable.
     """
-    o = urlparse(website)
-    if not (o.netloc or o.path) or "." not in website:
+    if "." not in website or not (m := _WEBSITE_REGEX.match(website)) or "." not in (host := m[2]) or not host.strip(".-"):
         raise HTTPException(400, "input website is malformed")
 
-    if (u := f"{o.scheme or 'https'}://{o.netloc or o.path}") in cache:
-        return _result_with_status(*cache.get(u), True)
+    u = f"{m[1].lower() if m[1] else 'https'}://{host}"
+    if (cached := _cache_for(u).get(u)) is not None:
+        return _result_with_status(*cached, True)
+
+    if (task := in_flight.get(u)) is None:
+        if not limiter.is_allowed():
+            raise HTTPException(429)
 
-    if not limiter.is_allowed():
-        raise HTTPException(429)
+        in_flight[u] = task = create_task(_query_website(u))
+        task.add_done_callback(lambda _: in_flight.pop(u, None))
 
     try:
-        async with client.stream("GET", u, headers={"User-Agent": choice(_USER_AGENTS)}) as response:
-            cache[u] = (response.status_code, _now_timestamp())
-            return _result_with_status(*cache[u])
-    except RequestError:
-        cache[u] = (_UNREACHABLE_STATUS, _now_timestamp())
-        return _result_with_status(*cache[u])
-    except:
-        raise HTTPException(500, "Server error, unable to reach target website")
+        return _result_with_status(*(await shield(task)))
+    except Exception:
+        raise HTTPException(500, "Server error, unable to reach target website") from None
 
 
 if __name__ == "__main__":
-    uvicorn.run("is_it_up.__main__:app", reload=True)
+    uvicorn.run("is_it_up.__main__:app", uds=environ.get("IS_IT_UP_UDS"), loop="uvloop", http="httptools", reload=True)
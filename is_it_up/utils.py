@@ -1,19 +1,62 @@
 """Utility classes/functions for is_it_up"""
 
-from http.cookiejar import CookieJar
-from time import time
+from collections.abc import Hashable
+from heapq import heappop, heappush
+from time import monotonic, monotonic_ns
+from typing import Any
 
 
-class NullCookieJar(CookieJar):
-    """A CookieJar that rejects all cookies."""
+class ExpiringDict:
+    """A dict-backed cache whose entries expire after a fixed time to live.  Meant to be used from a single event loop, so no locking is performed."""
 
-    def extract_cookies(self, *_):
-        """For extracting and saving cookies.  This implementation does nothing"""
-        pass
+    __slots__ = ("_data", "_expiries", "_ttl")
 
-    def set_cookie(self, _):
-        """Normally for setting a cookie.  This implementation does nothing"""
-        pass
+    def __init__(self, ttl: float):
+        """Initializer, creates a new ExpiringDict
+
+        Args:
+            ttl (float): The number of seconds each entry is retained for after being set.
+        """
+        self._data: dict[Hashable, tuple[Any, float]] = {}  # key -> (value, expiry time)
+        self._expiries: list[tuple[float, Hashable]] = []  # min-heap of (expiry time, key), used for eviction
+        self._ttl = ttl
+
+    def __getitem__(self, key: Hashable) -> Any:
+        """Gets the value associated with `key`.  Raises `KeyError` if `key` is missing or expired."""
+        if (entry := self._data.get(key)) is None or entry[1] <= monotonic():
+            raise KeyError(key)
+
+        return entry[0]
+
+    def __setitem__(self, key: Hashable, value: Any):
+        """Associates `value` with `key`, (re)starting its time to live.  Expired entries are evicted first."""
+        self.expire()
+
+        self._data[key] = (value, expiry := monotonic() + self._ttl)
+        heappush(self._expiries, (expiry, key))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Gets the value associated with `key` if it exists and has not expired.
+
+        Args:
+            key (Hashable): The key to look up
+            default (Any, optional): The value to return if `key` is missing or expired. Defaults to None.
+
+        Returns:
+            Any: The value associated with `key`, or `default`.
+        """
+        if (entry := self._data.get(key)) is None or entry[1] <= monotonic():
+            return default
+
+        return entry[0]
+
+    def expire(self):
+        """Evicts all expired entries.  Runs on every insert, so only the entries that have actually expired are visited."""
+        now = monotonic()
+        while self._expiries and self._expiries[0][0] <= now:
+            _, key = heappop(self._expiries)
+            if (entry := self._data.get(key)) is not None and entry[1] <= now:
+                del self._data[key]
 
 
 class TokenBucketRateLimiter:
@@ -28,8 +71,7 @@ class TokenBucketRateLimiter:
         """
         self._capacity = capacity  # Maximum tokens the bucket can hold
         self._fill_rate = fill_rate  # Tokens added per second
-        self._tokens = capacity  # Current number of tokens in the bucket
-        self._last_time = int(time())  # Last time tokens were added
+        self._state = (monotonic_ns() // 1_000_000_000, capacity)  # Last time tokens were added, current number of tokens in the bucket
 
     def is_allowed(self, tokens_requested: int = 1) -> bool:
         """Determines if whatever action the TokenBucketRateLimiter is being used to track can be performed
@@ -40,10 +82,11 @@ class TokenBucketRateLimiter:
         Returns:
             bool: `True` if there are sufficient tokens available to perform the action being tracked.
         """
-        self._tokens = min(self._capacity, self._tokens + ((current_time := int(time())) - self._last_time) * self._fill_rate)
-        self._last_time = current_time
+        last_time, tokens = self._state
+        tokens = min(self._capacity, tokens + ((current_time := monotonic_ns() // 1_000_000_000) - last_time) * self._fill_rate)
+
+        if allowed := tokens >= tokens_requested:
+            tokens -= tokens_requested
 
-        if self._tokens >= tokens_requested:
-            self._tokens -= tokens_requested
-            return True
-        return False
+        self._state = (current_time, tokens)
+        return allowed
@@ -17,7 +17,7 @@ setuptools.setup(
     },
     include_package_data=True,
     packages=setuptools.find_packages(include=["is_it_up"]),
-    install_requires=['cachetools', 'fastapi[all]', 'gunicorn', 'httpx[http2]', 'spawn-user-agent'],
+    install_requires=['aiodns', 'aiohttp', 'fastapi[all]', 'gunicorn', 'httptools', 'orjson', 'uvicorn[standard]', 'uvloop'],
     classifiers=[
         "Natural Language :: English",
         "Programming Language :: Python :: 3",